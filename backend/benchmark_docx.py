@@ -0,0 +1,150 @@
+"""Benchmark the streaming DOCX extractor against the python-docx extractor.
+
+Generates large DOCX files (paragraphs, tables, a header and footnotes) and
+runs each extractor in a fresh process, reporting wall time, peak RSS growth
+and how much text each one recovered.
+
+    python benchmark_docx.py --paragraphs 50000 100000 --tables 200
+
+The baseline needs python-docx (pip install python-docx==1.1.0), which the
+API itself no longer depends on.
+"""
+import argparse
+import importlib
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/header1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>
+<Override PartName="/word/footnotes.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"/>
+</Types>"""
+
+PACKAGE_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+DOCUMENT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/header" Target="header1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/footnotes" Target="footnotes.xml"/>
+</Relationships>"""
+
+SENTENCE = "Photosynthesis converts light energy into chemical energy stored in glucose molecules."
+
+
+def _paragraph(text: str) -> str:
+    return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+def generate_docx(path: str, paragraphs: int, tables: int, rows_per_table: int = 20) -> None:
+    """Write a DOCX with the given number of body paragraphs and 3-column tables"""
+    table_every = max(1, paragraphs // tables) if tables else 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", CONTENT_TYPES)
+        docx.writestr("_rels/.rels", PACKAGE_RELS)
+        docx.writestr("word/_rels/document.xml.rels", DOCUMENT_RELS)
+        docx.writestr(
+            "word/header1.xml",
+            f'<w:hdr xmlns:w="{W_NS}">{_paragraph("Biology Course Notes")}</w:hdr>'
+        )
+        docx.writestr(
+            "word/footnotes.xml",
+            f'<w:footnotes xmlns:w="{W_NS}">'
+            + "".join(f'<w:footnote w:id="{i}">{_paragraph(f"Footnote {i}: {SENTENCE}")}</w:footnote>'
+                      for i in range(1, 101))
+            + "</w:footnotes>"
+        )
+        with docx.open("word/document.xml", "w") as out:
+            out.write(f'<w:document xmlns:w="{W_NS}" xmlns:r="{R_NS}"><w:body>'.encode())
+            written_tables = 0
+            for i in range(paragraphs):
+                out.write(_paragraph(f"{i}. {SENTENCE}").encode())
+                if table_every and written_tables < tables and (i + 1) % table_every == 0:
+                    row = "".join(
+                        f"<w:tc>{_paragraph(f'Cell {c}')}</w:tc>" for c in range(3)
+                    )
+                    out.write(("<w:tbl>" + f"<w:tr>{row}</w:tr>" * rows_per_table + "</w:tbl>").encode())
+                    written_tables += 1
+            out.write(b"<w:sectPr/></w:body></w:document>")
+
+
+def python_docx_extract(file_content: bytes) -> str:
+    """The python-docx based extractor this benchmark compares against"""
+    from docx import Document
+    text = ""
+    doc = Document(io.BytesIO(file_content))
+    for paragraph in doc.paragraphs:
+        text += paragraph.text + "\n"
+    return text.strip()
+
+
+def streaming_extract(file_content: bytes) -> str:
+    from main import DocumentProcessor
+    return DocumentProcessor.extract_text_from_docx(file_content)
+
+
+EXTRACTORS = {"python-docx": python_docx_extract, "streaming": streaming_extract}
+
+
+def _measure(name: str, path: str, results) -> None:
+    extractor = EXTRACTORS[name]
+    # Keep import cost out of the measurement
+    importlib.import_module("main" if name == "streaming" else "docx")
+    with open(path, "rb") as f:
+        file_content = f.read()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    text = extractor(file_content)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, (rss_after - rss_before) / 1024, len(text)))
+
+
+def run(name: str, path: str):
+    """Run one extractor in a fresh process so peak RSS is not shared between runs"""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(name, path, results))
+    process.start()
+    outcome = results.get()
+    process.join()
+    return outcome
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'paragraphs':>10} {'size MB':>8} {'extractor':>12} {'best s':>8} {'peak MB':>8} {'chars':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for paragraphs in args.paragraphs:
+            path = os.path.join(tmp, f"bench_{paragraphs}.docx")
+            generate_docx(path, paragraphs, args.tables)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            for name in EXTRACTORS:
+                runs = [run(name, path) for _ in range(args.repeat)]
+                best = min(r[0] for r in runs)
+                peak = max(r[1] for r in runs)
+                chars = runs[0][2]
+                print(f"{paragraphs:>10} {size_mb:>8.1f} {name:>12} {best:>8.2f} {peak:>8.1f} {chars:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,25 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from dotenv import load_dotenv
 import google.generativeai as genai
 import io
 import json
-import tempfile
 import os
+import re
+import random
+import secrets
+import threading
+import zipfile
+import zlib
+import hashlib
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque, OrderedDict
+from xml.etree import ElementTree
 import base64
 load_dotenv()
 
@@ -20,12 +30,6 @@ try:
 except ImportError:
     PYPDF2_AVAILABLE = False
 
-try:
-    from docx import Document
-    DOCX_AVAILABLE = True
-except ImportError:
-    DOCX_AVAILABLE = False
-
 try:
     from PIL import Image
     PIL_AVAILABLE = True
@@ -46,11 +50,17 @@ except ImportError:
     AUDIO_AVAILABLE = False
 
 try:
-    from fpdf import FPDF
+    from fpdf import FPDF, FPDF_VERSION
     PDF_EXPORT_AVAILABLE = True
 except ImportError:
     PDF_EXPORT_AVAILABLE = False
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 # Initialize FastAPI
 app = FastAPI(
     title="AI Question Generator & Exam System API",
@@ -58,6 +68,45 @@ app = FastAPI(
     version="1.0.0"
 )
 
+class UploadSizeLimitMiddleware:
+    """Reject oversized uploads while the body is still arriving.
+
+    A Content-Length over the limit is refused before any of the body is read;
+    chunked requests are counted as they stream in and cut off with a 413 as
+    soon as they pass it, before the multipart body is fully parsed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = UPLOAD_REQUEST_LIMITS.get(scope["path"]) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse(status_code=413, content={"detail": "Upload too large"})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside form parsing, so FastAPI turns it into the response
+                    raise HTTPException(status_code=413, detail="Upload too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# Upload size middleware (registered before CORS so rejections still carry CORS headers)
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -72,6 +121,53 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "")
 MISTRAL_BASE_URL = "https://api.mistral.ai/v1"
 
+# PDF export configuration
+PDF_FONT_PATH = os.getenv("PDF_FONT_PATH", "")  # Optional Unicode TTF font for non-Latin papers
+PDF_EXPORT_WORKERS = int(os.getenv("PDF_EXPORT_WORKERS", str(os.cpu_count() or 2)))
+
+# Number of question sets kept in the in-process cache
+QUESTION_SET_CACHE_SIZE = int(os.getenv("QUESTION_SET_CACHE_SIZE", "256"))
+# Question set ids per in_() filter when loading cache misses, keeping request URLs short
+QUESTION_SET_LOAD_CHUNK = int(os.getenv("QUESTION_SET_LOAD_CHUNK", "50"))
+
+# Local pre-grading of subjective answers: similarity to the sample answer at or above the
+# high threshold earns full marks (same negations, comparable length), and a very short
+# answer (under PREGRADE_SHORT_ANSWER_RATIO of the sample's length) at or below the low
+# threshold earns zero. Everything else is sent to the model
+PREGRADE_LOW_THRESHOLD = float(os.getenv("PREGRADE_LOW_THRESHOLD", "0.1"))
+PREGRADE_HIGH_THRESHOLD = float(os.getenv("PREGRADE_HIGH_THRESHOLD", "0.9"))
+PREGRADE_SHORT_ANSWER_RATIO = float(os.getenv("PREGRADE_SHORT_ANSWER_RATIO", "0.25"))
+# Word-bigram overlap with the sample answer (Dice) also needed for local full marks, since
+# TF-IDF cosine ignores word order ("light into chemical" vs "chemical into light")
+PREGRADE_BIGRAM_THRESHOLD = float(os.getenv("PREGRADE_BIGRAM_THRESHOLD", "0.8"))
+
+# Reuse of previously generated questions: at most this share of each type is taken from
+# stored questions for the same document and difficulty, and questions whose estimated Jaccard
+# similarity (over content words and their bigrams) reaches the threshold count as duplicates
+QUESTION_REUSE_RATIO = float(os.getenv("QUESTION_REUSE_RATIO", "0.5"))
+QUESTION_DUPLICATE_THRESHOLD = float(os.getenv("QUESTION_DUPLICATE_THRESHOLD", "0.55"))
+QUESTION_REUSE_INDEX_SIZE = int(os.getenv("QUESTION_REUSE_INDEX_SIZE", "128"))
+# Model calls per question type, re-asking for questions dropped as near-duplicates
+QUESTION_GENERATION_ATTEMPTS = int(os.getenv("QUESTION_GENERATION_ATTEMPTS", "3"))
+
+# Upload limits, checked while the parsed upload is hashed and sniffed; Starlette has already
+# spooled uploads over 1MB to disk, and the file is used from there
+MAX_DOCUMENT_UPLOAD_BYTES = int(os.getenv("MAX_DOCUMENT_UPLOAD_MB", "20")) * 1024 * 1024
+MAX_PDF_IMAGES_UPLOAD_BYTES = int(os.getenv("MAX_PDF_IMAGES_UPLOAD_MB", "20")) * 1024 * 1024
+MAX_ANSWER_UPLOAD_BYTES = int(os.getenv("MAX_ANSWER_UPLOAD_MB", "10")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Whole-request limits per upload endpoint (file limits plus room for the multipart envelope)
+UPLOAD_REQUEST_LIMITS = {
+    "/extract-text": MAX_DOCUMENT_UPLOAD_BYTES + 1024 * 1024,
+    "/api/generate-questions": MAX_DOCUMENT_UPLOAD_BYTES + 1024 * 1024,
+    "/pdf-to-images": MAX_PDF_IMAGES_UPLOAD_BYTES + 1024 * 1024,
+    "/api/answers": 2 * MAX_ANSWER_UPLOAD_BYTES + 1024 * 1024,
+}
+
+# Number of extracted document texts kept, keyed by upload hash
+EXTRACTED_TEXT_CACHE_SIZE = int(os.getenv("EXTRACTED_TEXT_CACHE_SIZE", "32"))
+
 # Configure Gemini
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
@@ -123,6 +219,7 @@ class Answer(BaseModel):
 class ExamSubmission(BaseModel):
     answers: List[Answer]
     username: Optional[str] = None
+    question_set_id: Optional[str] = None
 
 class EvaluationResponse(BaseModel):
     score: float
@@ -131,20 +228,204 @@ class EvaluationResponse(BaseModel):
     suggestions: Optional[str] = None
     correct: bool
 
+class ExamPaperRequest(BaseModel):
+    question_set_id: Optional[str] = None
+    questions: Optional[List[Question]] = None
+    title: Optional[str] = None
+    include_answers: bool = False
+    include_marks: bool = True
+
+class BatchExamPaperRequest(BaseModel):
+    papers: List[ExamPaperRequest]
+
+class ExamVariantRequest(BaseModel):
+    num_variants: int = 1
+    seed: Optional[int] = None
+    marks_per_type: Optional[Dict[str, int]] = None
+    include_answers: bool = False
+    create_exams: bool = False
+
+# WordprocessingML tags used by the streaming DOCX extractor
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_R, _W_T, _W_TAB, _W_BR, _W_CR = (_W + t for t in ("p", "r", "t", "tab", "br", "cr"))
+_W_TR, _W_TC = _W + "tr", _W + "tc"
+_DOCX_HEADER_FOOTER_RE = re.compile(r"word/(header|footer)(\d*)\.xml$")
+
+# Upload ingestion
+DOCUMENT_KINDS = ("pdf", "docx", "txt")
+IMAGE_KINDS = ("png", "jpeg", "gif", "webp")
+AUDIO_KINDS = ("mp3", "wav", "ogg", "webm", "mp4", "flac")
+
+# Leading bytes of each accepted format, checked in order
+_MAGIC_NUMBERS = [
+    (b"%PDF-", "pdf"),
+    (b"PK\x03\x04", "docx"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"ID3", "mp3"),
+    (b"\xff\xfb", "mp3"),
+    (b"\xff\xf3", "mp3"),
+    (b"\xff\xf2", "mp3"),
+    (b"OggS", "ogg"),
+    (b"\x1a\x45\xdf\xa3", "webm"),
+    (b"fLaC", "flac"),
+]
+
+def sniff_file_type(head: bytes) -> Optional[str]:
+    """Identify a file from its first bytes; anything without NUL bytes counts as text"""
+    for magic, kind in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return kind
+    if head[:4] == b"RIFF" and head[8:12] in (b"WEBP", b"WAVE"):
+        return "webp" if head[8:12] == b"WEBP" else "wav"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head and b"\x00" not in head:
+        return "txt"
+    return None
+
+class UploadedFile:
+    """A parsed upload that has been sniffed, hashed and size-checked.
+
+    Wraps Starlette's spooled file rather than copying it: small uploads stay in
+    memory, larger ones are used from the temporary file Starlette rolled them
+    over to.
+    """
+
+    def __init__(self, filename: str, kind: str, size: int, sha256: str, file: Any):
+        self.filename = filename
+        self.kind = kind
+        self.size = size
+        self.sha256 = sha256
+        self._file = file
+
+    @property
+    def path(self) -> Optional[str]:
+        """A path to the upload's on-disk spool, or None while it is held in memory"""
+        if not getattr(self._file, "_rolled", False):
+            return None
+        name = getattr(self._file._file, "name", None)
+        if isinstance(name, str):
+            return name
+        # Rolled-over spools are unnamed temporary files; Linux still exposes them by descriptor
+        fd_path = f"/proc/self/fd/{self._file.fileno()}"
+        return fd_path if os.path.exists(fd_path) else None
+
+    def read(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    def open(self):
+        """Binary file object over the upload, positioned at the start"""
+        path = self.path
+        if path:
+            return open(path, "rb")
+        self._file.seek(0)
+        return io.BytesIO(self._file.read())
+
+    def source(self) -> Any:
+        """Path of an upload on disk, or its bytes when it is held in memory"""
+        return self.path or self.read()
+
+    def to_base64(self) -> str:
+        """Base64 text of the upload, encoded chunk by chunk rather than from one full read"""
+        chunk_size = UPLOAD_CHUNK_SIZE - UPLOAD_CHUNK_SIZE % 3  # Whole 3-byte groups, so no padding mid-stream
+        with self.open() as f:
+            return "".join(base64.b64encode(chunk).decode() for chunk in iter(lambda: f.read(chunk_size), b""))
+
+    def close(self):
+        """Close the spool, which also removes its temporary file"""
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+async def read_upload(upload: UploadFile, allowed_kinds: tuple, max_bytes: int) -> UploadedFile:
+    """Sniff, size-check and hash a parsed upload in chunks, without copying it.
+
+    The multipart body has been parsed by the time this runs, so oversized
+    requests are stopped earlier by UploadSizeLimitMiddleware; this enforces the
+    per-file limit and type.
+    """
+    digest = hashlib.sha256()
+    kind, size = None, 0
+    try:
+        await upload.seek(0)
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if kind is None:
+                kind = sniff_file_type(chunk)
+                if kind not in allowed_kinds:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Unsupported file type. Expected {', '.join(allowed_kinds).upper()}"
+                    )
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB"
+                )
+            digest.update(chunk)
+        if kind is None:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    except BaseException:
+        await upload.close()
+        raise
+
+    uploaded = UploadedFile(upload.filename, kind, size, digest.hexdigest(), upload.file)
+    if kind == "docx":
+        # Any zip starts with PK; only accept it as DOCX if it has a Word body
+        try:
+            with uploaded.open() as f, zipfile.ZipFile(f) as archive:
+                is_docx = "word/document.xml" in archive.namelist()
+        except zipfile.BadZipFile:
+            is_docx = False
+        if not is_docx:
+            uploaded.close()
+            raise HTTPException(status_code=400, detail="Unsupported file type. ZIP archive is not a DOCX document")
+    return uploaded
+
 # Utility Functions
 class DocumentProcessor:
     """Handles document processing for various file types"""
     
+    _text_cache: "OrderedDict[str, str]" = OrderedDict()
+    
     @staticmethod
-    def extract_text_from_pdf(file_content: bytes) -> str:
-        """Extract text from PDF using PyMuPDF first, fallback to PyPDF2"""
+    def extract_text(upload: UploadedFile) -> str:
+        """Extract text from a sniffed upload, reusing earlier results for identical files"""
+        cache = DocumentProcessor._text_cache
+        if upload.sha256 in cache:
+            cache.move_to_end(upload.sha256)
+            return cache[upload.sha256]
+        
+        if upload.kind == "pdf":
+            text = DocumentProcessor.extract_text_from_pdf(upload.source())
+        elif upload.kind == "docx":
+            with upload.open() as f:
+                text = DocumentProcessor.extract_text_from_docx(f)
+        else:
+            text = DocumentProcessor.extract_text_from_txt(upload.read())
+        
+        if text:
+            cache[upload.sha256] = text
+            while len(cache) > EXTRACTED_TEXT_CACHE_SIZE:
+                cache.popitem(last=False)
+        return text
+    
+    @staticmethod
+    def extract_text_from_pdf(file_content: Any) -> str:
+        """Extract text from PDF bytes or a PDF file path using PyMuPDF first, fallback to PyPDF2"""
         text = ""
         
         # Try PyMuPDF first
         if FITZ_AVAILABLE:
             try:
-                pdf_stream = io.BytesIO(file_content)
-                with fitz.open(stream=pdf_stream, filetype="pdf") as pdf:
+                with DocumentProcessor._open_pdf(file_content) as pdf:
                     for page in pdf:
                         page_text = page.get_text("text")
                         if page_text:
@@ -155,11 +436,14 @@ class DocumentProcessor:
         # Fallback to PyPDF2 if no text extracted
         if not text.strip() and PYPDF2_AVAILABLE:
             try:
-                reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
+                # A file object lets PyPDF2 seek on disk; given a path it reads the whole file
+                with (open(file_content, "rb") if isinstance(file_content, str)
+                      else io.BytesIO(file_content)) as pdf_file:
+                    reader = PyPDF2.PdfReader(pdf_file)
+                    for page in reader.pages:
+                        page_text = page.extract_text()
+                        if page_text:
+                            text += page_text + "\n"
             except Exception as e:
                 print(f"[PyPDF2] Error extracting text: {e}")
         
@@ -167,17 +451,90 @@ class DocumentProcessor:
 
     
     @staticmethod
-    def extract_text_from_docx(file_content: bytes) -> str:
-        """Extract text from DOCX file"""
-        text = ""
+    def _open_pdf(file_content: Any):
+        """Open a PDF with PyMuPDF, straight from disk when given a path"""
+        if isinstance(file_content, str):
+            return fitz.open(file_content)
+        return fitz.open(stream=file_content, filetype="pdf")
+
+    @staticmethod
+    def extract_text_from_docx(file_content: Any) -> str:
+        """Extract text from DOCX bytes or file, including tables, headers, footers and notes"""
         try:
-            if DOCX_AVAILABLE:
-                doc = Document(io.BytesIO(file_content))
-                for paragraph in doc.paragraphs:
-                    text += paragraph.text + "\n"
+            return "\n".join(DocumentProcessor.iter_docx_lines(file_content)).strip()
         except Exception as e:
             print(f"Error extracting DOCX text: {str(e)}")
-        return text.strip()
+            return ""
+    
+    @staticmethod
+    def iter_docx_lines(source: Any) -> Iterator[str]:
+        """Yield the text lines of a DOCX (bytes or binary file) part by part"""
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        with zipfile.ZipFile(source) as docx:
+            names = set(docx.namelist())
+            header_footers = sorted(
+                (m.group(1) != "header", int(m.group(2) or 0), m.group(0))
+                for m in map(_DOCX_HEADER_FOOTER_RE.match, names) if m
+            )
+            parts = ["word/document.xml"] + [name for _, _, name in header_footers]
+            parts += ["word/footnotes.xml", "word/endnotes.xml"]
+            for part in parts:
+                if part in names:
+                    with docx.open(part) as stream:
+                        yield from DocumentProcessor._iter_wordml_lines(stream)
+    
+    @staticmethod
+    def _iter_wordml_lines(stream: Any) -> Iterator[str]:
+        """Stream paragraphs and table rows out of one WordprocessingML part.
+
+        Every element is detached as soon as it ends, so memory stays constant
+        however large the part is. Table rows come out as tab-separated cells.
+        """
+        stack, paragraphs, rows, cells = [], [], [], []
+        for event, elem in ElementTree.iterparse(stream, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                stack.append(elem)
+                if tag == _W_P:
+                    paragraphs.append([])
+                elif tag == _W_TR:
+                    rows.append([])
+                elif tag == _W_TC:
+                    cells.append([])
+                continue
+            
+            stack.pop()
+            line = None
+            if tag == _W_T:
+                if paragraphs:
+                    paragraphs[-1].append(elem.text or "")
+            elif tag == _W_TAB or tag == _W_BR or tag == _W_CR:
+                # w:tab also defines tab stops in paragraph properties; only runs carry text
+                if paragraphs and stack and stack[-1].tag == _W_R:
+                    paragraphs[-1].append("\t" if tag == _W_TAB else "\n")
+            elif tag == _W_P:
+                line = "".join(paragraphs.pop()).strip()
+            elif tag == _W_TC:
+                cell = " ".join(cells.pop())
+                if rows:
+                    rows[-1].append(cell)
+            elif tag == _W_TR:
+                row = rows.pop()
+                while row and not row[-1]:
+                    row.pop()
+                if row:
+                    line = "\t".join(row)
+            
+            if line:
+                if cells:
+                    cells[-1].append(line)
+                else:
+                    yield line
+            
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
     
     @staticmethod
     def extract_text_from_txt(file_content: bytes) -> str:
@@ -192,26 +549,18 @@ class DocumentProcessor:
                 return ""
     
     @staticmethod
-    def pdf_to_images(file_content: bytes) -> List[Any]:
-        """Convert PDF to images using PyMuPDF"""
+    def pdf_to_images(file_content: Any) -> List[Any]:
+        """Convert PDF bytes or a PDF file path to images using PyMuPDF"""
         images = []
         if not FITZ_AVAILABLE or not PIL_AVAILABLE:
             return images
         
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(file_content)
-                tmp_path = tmp_file.name
-            
-            doc = fitz.open(tmp_path)
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                pix = page.get_pixmap(dpi=200)
-                img = Image.open(io.BytesIO(pix.tobytes("png")))
-                images.append(img)
-            
-            doc.close()
-            os.unlink(tmp_path)
+            with DocumentProcessor._open_pdf(file_content) as doc:
+                for page in doc:
+                    pix = page.get_pixmap(dpi=200)
+                    img = Image.open(io.BytesIO(pix.tobytes("png")))
+                    images.append(img)
         except Exception as e:
             print(f"Error converting PDF to images: {str(e)}")
         
@@ -256,7 +605,8 @@ class AIModelAPI:
             [
                 {{
                     "question": "Question text here?",
-                    "hint": "Brief hint for answering"
+                    "hint": "Brief hint for answering",
+                    "sample_answer": "Model answer that would earn full marks"
                 }}
             ]
             """
@@ -274,7 +624,7 @@ class AIModelAPI:
                     json={
                         "model": "mistral-small",
                         "messages": [{"role": "user", "content": prompt}],
-                        "max_tokens": 1000,
+                        "max_tokens": 1000 if question_type == "mcq" else 3000,
                         "temperature": 0.7
                     }
                 )
@@ -301,7 +651,8 @@ class AIModelAPI:
                         marks=marks,
                         options=q_data.get("options"),
                         correct_answer=q_data.get("correct_answer"),
-                        hint=q_data.get("hint")
+                        hint=q_data.get("hint"),
+                        sample_answer=q_data.get("sample_answer")
                     )
                     questions.append(question)
                 return questions
@@ -391,6 +742,153 @@ class AIModelAPI:
                 "correct": False
             }
 
+    @staticmethod
+    def evaluate_answers(items: List[Any], model_choice: str = "Gemini",
+                         subject: str = "General Knowledge") -> List[Dict]:
+        """Evaluate (question, answer) pairs, calling the model only for unclear subjective answers"""
+        results: List[Optional[Dict]] = [None] * len(items)
+        subjective = []
+        for i, (question, user_answer) in enumerate(items):
+            if question.type == "mcq":
+                results[i] = AIModelAPI.evaluate_answer(question, user_answer, model_choice, subject)
+            elif not (user_answer or "").strip():
+                results[i] = {
+                    "score": 0,
+                    "max_score": question.marks,
+                    "feedback": "No answer provided.",
+                    "correct": False,
+                    "graded_by": "pregrade"
+                }
+            else:
+                subjective.append(i)
+
+        if subjective and NUMPY_AVAILABLE:
+            sample_sim, reference_sim, coverage = AnswerPreGrader.similarities([items[i] for i in subjective])
+            for n, i in enumerate(subjective):
+                results[i] = AnswerPreGrader.settle(
+                    items[i][0], items[i][1], sample_sim[n], reference_sim[n], coverage[n]
+                )
+
+        for i in subjective:
+            if results[i] is None:
+                question, user_answer = items[i]
+                results[i] = AIModelAPI.evaluate_answer(question, user_answer, model_choice, subject)
+                results[i]["graded_by"] = "model"
+        return results
+
+# Common English words ignored when comparing answers
+_PREGRADE_STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have how if in into is it its
+of on or so such than that the their them then there these they this to was were what
+when where which who why will with would you your
+""".split())
+
+# Words that flip the meaning of an answer but not its bag of words
+_PREGRADE_NEGATION = re.compile(r"\b(?:not|no|never|none|nor|neither|cannot|without|nothing)\b|n't\b")
+
+class AnswerPreGrader:
+    """Scores subjective answers locally by TF-IDF cosine similarity to their references"""
+
+    @staticmethod
+    def _tokenize(text: Optional[str]) -> List[str]:
+        return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if t not in _PREGRADE_STOPWORDS]
+
+    @staticmethod
+    def _negations(text: Optional[str]) -> int:
+        return len(_PREGRADE_NEGATION.findall((text or "").lower()))
+
+    @staticmethod
+    def _bigram_overlap(answer: Optional[str], reference: Optional[str]) -> float:
+        """Dice overlap of the word bigrams (all words, in order) of two texts"""
+        grams = []
+        for text in (answer, reference):
+            words = re.findall(r"[a-z0-9]+", (text or "").lower())
+            grams.append(set(zip(words, words[1:])) or set(words))
+        if not grams[0] or not grams[1]:
+            return 0.0
+        return 2 * len(grams[0] & grams[1]) / (len(grams[0]) + len(grams[1]))
+
+    @staticmethod
+    def similarities(items: List[Any]):
+        """Vectorize every answer and its sample answer and hint in one TF-IDF matrix.
+
+        IDF is taken per question from its own references, so an answer scores the
+        same whatever else is in the batch. Returns, per answer, cosine similarity to
+        the sample answer, the best similarity to either reference, and answer length
+        relative to the sample.
+        """
+        tokenized = []
+        for question, user_answer in items:
+            tokenized += [
+                AnswerPreGrader._tokenize(user_answer),
+                AnswerPreGrader._tokenize(question.sample_answer),
+                AnswerPreGrader._tokenize(question.hint)
+            ]
+        vocab: Dict[str, int] = {}
+        for tokens in tokenized:
+            for token in tokens:
+                vocab.setdefault(token, len(vocab))
+
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=float).reshape(len(items), 3)
+        coverage = lengths[:, 0] / np.maximum(lengths[:, 1], 1)
+        if not vocab:
+            zeros = np.zeros(len(items))
+            return zeros, zeros, coverage
+
+        rows = np.repeat(np.arange(len(tokenized)), [len(tokens) for tokens in tokenized])
+        cols = np.fromiter((vocab[t] for tokens in tokenized for t in tokens), dtype=np.intp, count=rows.size)
+        tf = np.zeros((len(tokenized), len(vocab)))
+        np.add.at(tf, (rows, cols), 1)
+        tf = tf.reshape(len(items), 3, len(vocab))
+
+        # Sublinear term frequency with smoothed IDF over each question's references
+        references = np.count_nonzero(lengths[:, 1:], axis=1)[:, None]
+        df = np.count_nonzero(tf[:, 1:], axis=1)
+        idf = np.log((1 + references) / (1 + df)) + 1
+        tfidf = np.log1p(tf) * idf[:, None, :]
+        norms = np.linalg.norm(tfidf, axis=2, keepdims=True)
+        tfidf /= np.where(norms == 0, 1, norms)
+
+        cosine = np.einsum("nv,nrv->nr", tfidf[:, 0], tfidf[:, 1:])
+        return cosine[:, 0], cosine.max(axis=1), coverage
+
+    @staticmethod
+    def settle(question: Question, user_answer: str, sample_similarity: float, reference_similarity: float,
+               coverage: float, low: Optional[float] = None, high: Optional[float] = None) -> Optional[Dict]:
+        """Return a result for a clear-cut answer, or None if the model should grade it"""
+        low = PREGRADE_LOW_THRESHOLD if low is None else low
+        high = PREGRADE_HIGH_THRESHOLD if high is None else high
+        if not question.sample_answer:
+            return None
+
+        # Full marks need a near-verbatim match to the sample answer: close in TF-IDF,
+        # the same words in the same order, and the same negations. Bag-of-words
+        # similarity alone cannot tell "is" from "is not" or "A into B" from "B into A"
+        if (sample_similarity >= high and coverage >= 0.5
+                and AnswerPreGrader._bigram_overlap(user_answer, question.sample_answer) >= PREGRADE_BIGRAM_THRESHOLD
+                and AnswerPreGrader._negations(user_answer) == AnswerPreGrader._negations(question.sample_answer)):
+            return {
+                "score": question.marks,
+                "max_score": question.marks,
+                "feedback": "Answer closely matches the expected answer.",
+                "correct": True,
+                "graded_by": "pregrade",
+                "similarity": round(float(sample_similarity), 3)
+            }
+        # Only a very short answer is failed locally; a longer answer with little word
+        # overlap may be a paraphrase, so it goes to the model
+        if coverage < PREGRADE_SHORT_ANSWER_RATIO and reference_similarity <= low:
+            return {
+                "score": 0,
+                "max_score": question.marks,
+                "feedback": "Answer does not address the question.",
+                "suggestions": f"Hint: {question.hint}" if question.hint else "",
+                "correct": False,
+                "graded_by": "pregrade",
+                "similarity": round(float(reference_similarity), 3)
+            }
+        return None
+
 class AudioProcessor:
     """Handles audio processing"""
     
@@ -414,6 +912,682 @@ class AudioProcessor:
             print(f"Error generating speech: {str(e)}")
             return b""
 
+# Exam paper sections, in print order
+QUESTION_SECTIONS = [
+    ("mcq", "Multiple Choice Questions"),
+    ("2_mark", "Short Answer Questions"),
+    ("5_mark", "Medium Answer Questions"),
+    ("10_mark", "Long Answer Questions"),
+]
+
+# Core PDF fonts are Latin-1 only; map common typographic characters before encoding
+_LATIN1_FALLBACKS = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "•": "*", "…": "...",
+})
+
+# Parsed TTF metrics, keyed by font path, shared by every render in this process
+_PDF_FONT_CACHE: Dict[str, Dict[str, Any]] = {}
+
+_pdf_export_pool: Optional[ProcessPoolExecutor] = None
+
+if PDF_EXPORT_AVAILABLE:
+    class ExamPDF(FPDF):
+        """FPDF document with a page-number footer"""
+        footer_font = "helvetica"
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font(self.footer_font, "", 8)
+            self.cell(0, 10, f"Page {self.page_no()}", 0, 0, "C")
+
+class _ZipStream:
+    """Write-only sink that lets zipfile emit an archive chunk by chunk"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class PDFExporter:
+    """Renders question sets to printable exam papers"""
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def layout(include_answers: bool, include_marks: bool) -> Dict[str, Any]:
+        """Build the (read-only) layout template for a combination of print options"""
+        sections = {}
+        for q_type, heading in QUESTION_SECTIONS:
+            if include_marks and q_type != "mcq":
+                heading += f" ({q_type.split('_')[0]} marks each)"
+            elif include_marks:
+                heading += " (1 mark each)"
+            sections[q_type] = heading
+        instructions = ["Answer all questions."]
+        if include_answers:
+            instructions.append("Answer key included for examiners.")
+        return {
+            "sections": sections,
+            "instructions": " ".join(instructions),
+            "title_size": 16,
+            "heading_size": 12,
+            "body_size": 11,
+            "line_height": 6,
+            "option_indent": 8,
+        }
+
+    @staticmethod
+    def _register_font(pdf: Any) -> str:
+        """Attach the exam font to pdf, parsing the TTF file only once per process"""
+        if not PDF_FONT_PATH:
+            return "helvetica"
+        # Reusing parsed metrics writes into FPDF.fonts / FPDF.font_files, whose layout is
+        # specific to fpdf 1.7.x (pinned in requirements.txt). Any other version goes through
+        # add_font, which still avoids re-parsing via fpdf's .pkl metrics cache.
+        if not FPDF_VERSION.startswith("1.7"):
+            pdf.add_font("examfont", "", PDF_FONT_PATH, uni=True)
+            return "examfont"
+        cached = _PDF_FONT_CACHE.get(PDF_FONT_PATH)
+        if cached is None:
+            probe = FPDF()
+            probe.add_font("examfont", "", PDF_FONT_PATH, uni=True)
+            cached = {"font": probe.fonts["examfont"], "files": probe.font_files}
+            _PDF_FONT_CACHE[PDF_FONT_PATH] = cached
+        # Metrics are shared; the glyph subset is per document
+        pdf.fonts["examfont"] = dict(cached["font"], i=len(pdf.fonts) + 1, subset=list(range(0, 32)))
+        pdf.font_files.update({key: dict(value) for key, value in cached["files"].items()})
+        return "examfont"
+
+    @staticmethod
+    def render(paper: Dict[str, Any]) -> bytes:
+        """Render a single exam paper to PDF bytes"""
+        layout = PDFExporter.layout(paper["include_answers"], paper["include_marks"])
+        pdf = ExamPDF()
+        pdf.set_auto_page_break(True, margin=20)
+        family = PDFExporter._register_font(pdf)
+        unicode_font = family != "helvetica"
+        bold, italic = ("", "") if unicode_font else ("B", "I")
+        pdf.footer_font = family
+        line_height = layout["line_height"]
+
+        def clean(value: Any) -> str:
+            text = str(value or "")
+            if unicode_font:
+                return text
+            return text.translate(_LATIN1_FALLBACKS).encode("latin-1", "replace").decode("latin-1")
+
+        pdf.add_page()
+        pdf.set_font(family, bold, layout["title_size"])
+        pdf.multi_cell(0, 8, clean(paper["title"]), 0, "C")
+        pdf.set_font(family, "", layout["body_size"])
+        details = [d for d in (paper.get("subject"), paper.get("difficulty")) if d]
+        if details:
+            pdf.multi_cell(0, line_height, clean(" | ".join(details)), 0, "C")
+        questions = paper["questions"]
+        if paper["include_marks"]:
+            total = sum(q["marks"] for q in questions)
+            pdf.multi_cell(0, line_height, f"Total Marks: {total}", 0, "C")
+        pdf.set_font(family, italic, layout["body_size"] - 1)
+        pdf.multi_cell(0, line_height, clean(layout["instructions"]), 0, "C")
+        pdf.ln(4)
+
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for q in questions:
+            grouped.setdefault(q["type"], []).append(q)
+        section_types = [t for t in layout["sections"] if t in grouped]
+        section_types += [t for t in grouped if t not in layout["sections"]]
+
+        number = 1
+        for index, q_type in enumerate(section_types):
+            heading = layout["sections"].get(q_type, "Questions")
+            pdf.set_font(family, bold, layout["heading_size"])
+            pdf.multi_cell(0, 8, clean(f"Section {chr(ord('A') + index)}: {heading}"))
+            pdf.ln(1)
+            for q in grouped[q_type]:
+                marks = ""
+                if paper["include_marks"]:
+                    marks = f"  [{q['marks']} mark{'s' if q['marks'] != 1 else ''}]"
+                pdf.set_font(family, "", layout["body_size"])
+                pdf.multi_cell(0, line_height, clean(f"{number}. {q['text']}{marks}"))
+                for key, value in (q.get("options") or {}).items():
+                    pdf.set_x(pdf.l_margin + layout["option_indent"])
+                    pdf.multi_cell(0, line_height, clean(f"{key}) {value}"))
+                if paper["include_answers"]:
+                    if q_type == "mcq":
+                        answer = q.get("correct_answer")
+                    else:
+                        answer = q.get("sample_answer") or q.get("hint")
+                    if answer:
+                        pdf.set_font(family, italic, layout["body_size"] - 1)
+                        pdf.set_x(pdf.l_margin + layout["option_indent"])
+                        pdf.multi_cell(0, line_height, clean(f"Answer: {answer}"))
+                pdf.ln(2)
+                number += 1
+
+        return pdf.output(dest="S").encode("latin-1")
+
+    @staticmethod
+    def stream_zip(papers: List[Dict[str, Any]]):
+        """Render papers on the worker pool and yield a ZIP archive as they complete"""
+        pool = _get_pdf_export_pool()
+        window = PDF_EXPORT_WORKERS * 2
+        sink = _ZipStream()
+        pending = deque()
+        try:
+            with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+                for index, paper in enumerate(papers):
+                    payload = json.dumps(paper, sort_keys=True)
+                    name = f"{index + 1:04d}_{_paper_slug(paper['title'])}.pdf"
+                    pending.append((name, pool.submit(_render_exam_paper, payload)))
+                    if len(pending) >= window:
+                        name, future = pending.popleft()
+                        archive.writestr(name, future.result())
+                        yield sink.drain()
+                while pending:
+                    name, future = pending.popleft()
+                    archive.writestr(name, future.result())
+                    yield sink.drain()
+            yield sink.drain()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+@lru_cache(maxsize=64)
+def _render_exam_paper(payload: str) -> bytes:
+    """Render a JSON-encoded paper; repeated papers render once per process"""
+    return PDFExporter.render(json.loads(payload))
+
+def _get_pdf_export_pool() -> ProcessPoolExecutor:
+    global _pdf_export_pool
+    if _pdf_export_pool is None:
+        _pdf_export_pool = ProcessPoolExecutor(max_workers=PDF_EXPORT_WORKERS)
+    return _pdf_export_pool
+
+def _paper_slug(title: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", title).strip("_")[:60] or "exam_paper"
+
+def _question_from_row(row: Dict[str, Any], question_id: int) -> Question:
+    """Convert a row of the questions table into a Question"""
+    return Question(
+        id=question_id,
+        text=row["question_text"],
+        type=row["question_type"],
+        marks=row["marks"],
+        options=row.get("options"),
+        correct_answer=row.get("correct_answer"),
+        hint=row.get("hint"),
+        sample_answer=row.get("sample_answer")
+    )
+
+def _question_row_order(row: Dict[str, Any]) -> Tuple[int, int, int, str]:
+    """Sort key putting a question set's rows in their generated order"""
+    position = row.get("position")
+    row_id = row.get("id")
+    numeric_id = row_id if isinstance(row_id, int) else 0
+    return (position is None, position or 0, numeric_id, str(row_id))
+
+def _build_exam_papers(requests: List[ExamPaperRequest]) -> List[Dict[str, Any]]:
+    """Resolve export requests into plain paper dicts ready for rendering"""
+    set_ids = [r.question_set_id for r in requests if r.questions is None and r.question_set_id]
+    stored = {}
+    if set_ids:
+        if not supabase:
+            raise HTTPException(status_code=400, detail="Database not configured; pass questions directly")
+        stored = question_set_cache.get_many(set_ids)
+
+    papers = []
+    for r in requests:
+        meta = {}
+        if r.questions is not None:
+            questions = r.questions
+        elif r.question_set_id:
+            entry = stored.get(str(r.question_set_id))
+            if entry is None:
+                raise HTTPException(status_code=404, detail=f"Question set not found: {r.question_set_id}")
+            meta, questions = entry["meta"], entry["questions"]
+        else:
+            raise HTTPException(status_code=400, detail="Each paper needs a question_set_id or questions")
+        papers.append({
+            "title": r.title or meta.get("title") or "Examination Paper",
+            "subject": meta.get("subject"),
+            "difficulty": meta.get("difficulty"),
+            "questions": [q.dict() for q in questions],
+            "include_answers": r.include_answers,
+            "include_marks": r.include_marks
+        })
+    return papers
+
+class ExamVariantGenerator:
+    """Builds seeded exam variants from a stored question pool without model calls"""
+
+    @staticmethod
+    def _shuffle_options(options: Optional[Dict[str, str]], correct_answer: Optional[str],
+                         rng: random.Random):
+        """Shuffle MCQ option texts across the same labels and remap the correct label"""
+        if not options:
+            return options, correct_answer
+        labels = sorted(options)
+        sources = labels[:]
+        rng.shuffle(sources)
+        shuffled = {label: options[source] for label, source in zip(labels, sources)}
+        if correct_answer in options:
+            correct_answer = labels[sources.index(correct_answer)]
+        return shuffled, correct_answer
+
+    @staticmethod
+    def validate_marks(marks_per_type: Any) -> Optional[Dict[str, int]]:
+        """Check a marks_per_type mapping of question type to non-negative mark total"""
+        if marks_per_type is None:
+            return None
+        if not isinstance(marks_per_type, dict) or not all(
+            isinstance(t, str) and isinstance(m, int) and not isinstance(m, bool) and m >= 0
+            for t, m in marks_per_type.items()
+        ):
+            raise ValueError("marks_per_type must map question types to non-negative whole marks")
+        return marks_per_type
+
+    @staticmethod
+    def build(rows: List[Dict[str, Any]], seed: int,
+              marks_per_type: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Return the question rows of the variant for seed, with options shuffled.
+
+        The same rows, seed and marks_per_type always give the same variant, so the
+        answer key can be rebuilt at grading time from the seed alone. Types listed in
+        marks_per_type are sampled down to that mark total (0 leaves the type out);
+        types it omits are kept whole.
+        """
+        ExamVariantGenerator.validate_marks(marks_per_type)
+        rng = random.Random(seed)
+        by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for row in sorted(rows, key=lambda r: str(r["id"])):
+            by_type.setdefault(row["question_type"], []).append(row)
+
+        if marks_per_type:
+            missing = [t for t, target in marks_per_type.items() if target and t not in by_type]
+            if missing:
+                raise ValueError(f"No questions of type {', '.join(missing)} in this question set")
+
+        section_order = [t for t, _ in QUESTION_SECTIONS if t in by_type]
+        section_order += [t for t in by_type if t not in section_order]
+
+        variant = []
+        for q_type in section_order:
+            candidates = by_type[q_type][:]
+            rng.shuffle(candidates)
+            target = marks_per_type.get(q_type) if marks_per_type else None
+            if target is not None:
+                picked, total = [], 0
+                for row in candidates:
+                    if total == target:
+                        break
+                    if total + row["marks"] <= target:
+                        picked.append(row)
+                        total += row["marks"]
+                if total != target:
+                    raise ValueError(f"Cannot make {target} marks of {q_type} questions from this question set")
+                candidates = picked
+
+            for row in candidates:
+                options, correct_answer = ExamVariantGenerator._shuffle_options(
+                    row.get("options"), row.get("correct_answer"), rng
+                )
+                variant.append(dict(row, options=options, correct_answer=correct_answer))
+        return variant
+
+class QuestionSetCache:
+    """In-process read-through LRU cache of question sets.
+
+    Question sets never change once created, so entries are filled when a set
+    is generated (or on first read) and only leave through LRU eviction or an
+    explicit invalidate().
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, question_set_id: Any, meta: Dict[str, Any], rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Cache a question set from its question_sets row and questions rows.
+
+        Rows are put in generated order (the position column, falling back to the
+        row id for sets saved before it existed) so question ids are the same
+        whatever order the database returned them in.
+        """
+        rows = sorted(rows, key=_question_row_order)
+        questions = [_question_from_row(row, row.get("position") or i + 1) for i, row in enumerate(rows)]
+        entry = {
+            "meta": meta,
+            "rows": rows,
+            "questions": questions,
+            "by_id": {q.id: q for q in questions}
+        }
+        with self._lock:
+            self._entries[str(question_set_id)] = entry
+            self._entries.move_to_end(str(question_set_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get(self, question_set_id: Any) -> Optional[Dict[str, Any]]:
+        """Return a cached question set, loading it from Supabase on a miss"""
+        return self.get_many([question_set_id]).get(str(question_set_id))
+
+    def get_many(self, question_set_ids: List[Any]) -> Dict[str, Dict[str, Any]]:
+        """Return cached question sets, loading all misses in two queries"""
+        found, missing = {}, []
+        with self._lock:
+            for set_id in dict.fromkeys(str(i) for i in question_set_ids):
+                entry = self._entries.get(set_id)
+                if entry is None:
+                    missing.append(set_id)
+                else:
+                    self._entries.move_to_end(set_id)
+                    found[set_id] = entry
+        if missing and supabase:
+            # Page every chunk to the end: a set is only cached once all its rows
+            # are loaded, and any failure leaves nothing cached
+            sets, rows = [], []
+            for start in range(0, len(missing), QUESTION_SET_LOAD_CHUNK):
+                chunk = missing[start:start + QUESTION_SET_LOAD_CHUNK]
+                sets.extend(_fetch_all_rows(lambda: supabase.table("question_sets")
+                                            .select("*", count="exact").in_("id", chunk).order("id")))
+                rows.extend(_fetch_all_rows(lambda: supabase.table("questions")
+                                            .select("*", count="exact").in_("question_set_id", chunk).order("id")))
+            rows_by_set: Dict[str, List[Dict[str, Any]]] = {}
+            for row in rows:
+                rows_by_set.setdefault(str(row["question_set_id"]), []).append(row)
+            for meta in sets:
+                set_id = str(meta["id"])
+                found[set_id] = self.put(set_id, meta, rows_by_set.get(set_id, []))
+        return found
+
+    def invalidate(self, question_set_id: Optional[Any] = None):
+        """Drop one question set, or every entry when no id is given"""
+        with self._lock:
+            if question_set_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(question_set_id), None)
+
+question_set_cache = QuestionSetCache(QUESTION_SET_CACHE_SIZE)
+
+class CohortAnalytics:
+    """Grades a whole cohort's MCQs at once and derives item and score statistics"""
+
+    @staticmethod
+    def compute(question_rows: List[Dict[str, Any]], exams: List[Dict[str, Any]],
+                answers: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build student x question matrices and compute every statistic from them.
+
+        Variant exams are graded against the key rebuilt from their seed; questions
+        left out of a variant are masked rather than counted as wrong.
+        """
+        mcqs = [row for row in question_rows if row["question_type"] == "mcq" and row.get("correct_answer")]
+        columns = {str(row["id"]): j for j, row in enumerate(mcqs)}
+        students = {str(exam["id"]): i for i, exam in enumerate(exams)}
+        n_students, n_questions = len(exams), len(mcqs)
+
+        # Option labels as small ints so keys and responses compare column-wise
+        codes: Dict[str, int] = {}
+        key = np.array([codes.setdefault(row["correct_answer"], len(codes)) for row in mcqs], dtype=np.int32)
+        keys = np.broadcast_to(key, (n_students, n_questions)).copy()
+        present = np.ones((n_students, n_questions), dtype=bool)
+
+        variants: Dict[str, List[Dict[str, Any]]] = {}
+        for i, exam in enumerate(exams):
+            if exam.get("variant_seed") is None:
+                continue
+            spec = json.dumps([exam["variant_seed"], exam.get("variant_marks")], sort_keys=True)
+            if spec not in variants:
+                variants[spec] = ExamVariantGenerator.build(
+                    question_rows, exam["variant_seed"], exam.get("variant_marks")
+                )
+            present[i] = False
+            for row in variants[spec]:
+                j = columns.get(str(row["id"]))
+                if j is not None:
+                    present[i, j] = True
+                    keys[i, j] = codes.setdefault(row["correct_answer"], len(codes))
+
+        responses = np.full((n_students, n_questions), -1, dtype=np.int32)
+        cells = [
+            (students[str(a["exam_id"])], columns[str(a["question_id"])], a.get("answer_text"))
+            for a in answers
+            if str(a["exam_id"]) in students and str(a["question_id"]) in columns and a.get("answer_text") is not None
+        ]
+        if cells:
+            rows_idx, cols_idx, texts = zip(*cells)
+            responses[list(rows_idx), list(cols_idx)] = [codes.setdefault(t, len(codes)) for t in texts]
+
+        marks = np.array([row["marks"] for row in mcqs], dtype=float)
+        correct = (responses == keys) & present
+        mcq_scores = correct @ marks
+        mcq_max = present @ marks
+
+        # Exam totals include subjective marks when the exam has been graded
+        obtained = np.array([
+            exam["obtained_marks"] if exam.get("obtained_marks") is not None else np.nan for exam in exams
+        ], dtype=float)
+        possible = np.array([
+            exam["total_marks"] if exam.get("total_marks") else np.nan for exam in exams
+        ], dtype=float)
+        obtained = np.where(np.isnan(obtained), mcq_scores, obtained)
+        possible = np.where(np.isnan(possible), mcq_max, possible)
+        percentages = np.divide(obtained * 100, possible, out=np.zeros(n_students), where=possible > 0)
+
+        # Discrimination index: difficulty in the top 27% of the cohort minus the bottom 27%
+        group = max(1, int(round(n_students * 0.27))) if n_students else 0
+        order = np.argsort(percentages, kind="stable")
+        lower, upper = order[:group], order[-group:] if group else order[:0]
+
+        def proportion_correct(index):
+            attempts = present[index].sum(axis=0)
+            return np.divide(correct[index].sum(axis=0), attempts, out=np.full(n_questions, np.nan),
+                             where=attempts > 0), attempts
+
+        difficulty, attempts = proportion_correct(slice(None))
+        discrimination = proportion_correct(upper)[0] - proportion_correct(lower)[0]
+        answered = ((responses >= 0) & present).sum(axis=0)
+
+        def number(value):
+            return None if np.isnan(value) else round(float(value), 3)
+
+        percentile_points = [10, 25, 50, 75, 90]
+        histogram_edges = np.linspace(0, 100, 11)
+        histogram = np.histogram(np.clip(percentages, 0, 100), bins=histogram_edges)[0] if n_students else np.zeros(10)
+        percentiles = np.percentile(percentages, percentile_points) if n_students else [np.nan] * 5
+
+        return {
+            "students": n_students,
+            "scores": {
+                "mean": number(percentages.mean()) if n_students else None,
+                "std": number(percentages.std()) if n_students else None,
+                "min": number(percentages.min()) if n_students else None,
+                "max": number(percentages.max()) if n_students else None,
+                "percentiles": {f"p{p}": number(v) for p, v in zip(percentile_points, percentiles)},
+                "distribution": [
+                    {"range": f"{int(histogram_edges[k])}-{int(histogram_edges[k + 1])}", "count": int(histogram[k])}
+                    for k in range(10)
+                ]
+            },
+            "questions": [{
+                "question_id": row["id"],
+                "text": row["question_text"],
+                "attempts": int(attempts[j]),
+                "answered": int(answered[j]),
+                "difficulty": number(difficulty[j]),
+                "discrimination": number(discrimination[j])
+            } for j, row in enumerate(mcqs)]
+        }
+
+def _fetch_all_rows(build_query, page_size: int = 1000) -> List[Dict[str, Any]]:
+    """Page through a Supabase select, which caps the rows returned per request.
+
+    When the query asks for count="exact", paging continues until that many rows
+    are read, so a server row cap below page_size cannot end the read early.
+    """
+    rows = []
+    while True:
+        response = build_query().range(len(rows), len(rows) + page_size - 1).execute()
+        rows.extend(response.data)
+        total = getattr(response, "count", None)
+        if not response.data or (len(rows) >= total if total is not None else len(response.data) < page_size):
+            return rows
+
+# Generic question wording ignored when comparing questions for duplicates
+_QUESTION_FILLER_WORDS = frozenset("""
+briefly called different following given important key known main major principal primary
+referred termed various
+""".split())
+
+class MinHashLSH:
+    """MinHash signatures with banded LSH buckets for near-duplicate question text"""
+
+    _PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, threshold: Optional[float] = None):
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = QUESTION_DUPLICATE_THRESHOLD if threshold is None else threshold
+        perm_rng = np.random.RandomState(1)
+        self._a = perm_rng.randint(1, self._PRIME, size=num_perm).astype(np.uint64)
+        self._b = perm_rng.randint(0, self._PRIME, size=num_perm).astype(np.uint64)
+        self._buckets: Dict[Any, List[int]] = {}
+        self._signatures: List[Any] = []
+        self._items: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @staticmethod
+    def shingles(text: str) -> set:
+        """Content words of a question and its ordered content-word bigrams.
+
+        Stopwords and generic filler ("main", "primary", "known as") are dropped and
+        plurals folded, so rewordings match while questions that share a template but
+        differ in their subject ("liver" / "kidney") or word order ("A affects B" /
+        "B affects A") do not.
+        """
+        words = [
+            w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+            for w in re.findall(r"[a-z0-9]+", text.lower())
+            if w not in _PREGRADE_STOPWORDS and w not in _QUESTION_FILLER_WORDS
+        ]
+        return set(words) | {" ".join(pair) for pair in zip(words, words[1:])} or {text.strip().lower()}
+
+    def signature(self, text: str):
+        """MinHash of the shingles of a question's text"""
+        shingles = self.shingles(text)
+        hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % self._PRIME).min(axis=1)
+
+    def _band_keys(self, signature) -> List[Any]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, item: Any, signature) -> None:
+        index = len(self._items)
+        self._items.append(item)
+        self._signatures.append(signature)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(index)
+
+    def query(self, signature) -> List[Any]:
+        """Items whose estimated Jaccard similarity to signature reaches the threshold"""
+        candidates = {i for key in self._band_keys(signature) for i in self._buckets.get(key, ())}
+        return [
+            self._items[i] for i in sorted(candidates)
+            if np.mean(self._signatures[i] == signature) >= self.threshold
+        ]
+
+    def items(self) -> List[Any]:
+        return list(zip(self._items, self._signatures))
+
+def _is_valid_question(question: Question) -> bool:
+    """Whether a generated question is complete enough to be reused"""
+    if len(question.text.strip()) < 10:
+        return False
+    if question.type == "mcq":
+        return bool(question.options) and len(question.options) >= 2 and question.correct_answer in question.options
+    return True
+
+class QuestionReuseIndex:
+    """Stored questions per document hash, difficulty and question type, for de-duplication and reuse"""
+
+    def __init__(self, max_documents: int):
+        self.max_documents = max_documents
+        self._documents: "OrderedDict[Tuple[str, str], Dict[str, MinHashLSH]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pools(self, document_hash: str, difficulty: str) -> Dict[str, MinHashLSH]:
+        """Per-type pools of a document at one difficulty, loading its stored questions on first use"""
+        key = (document_hash, difficulty)
+        with self._lock:
+            pools = self._documents.get(key)
+            if pools is not None:
+                self._documents.move_to_end(key)
+                return pools
+
+        pools = {}
+        if supabase:
+            sets = _fetch_all_rows(lambda: supabase.table("question_sets").select("id", count="exact")
+                                   .eq("document_hash", document_hash).eq("difficulty", difficulty).order("id"))
+            stored = question_set_cache.get_many([s["id"] for s in sets]) if sets else {}
+            for entry in stored.values():
+                self._add_to(pools, entry["questions"])
+
+        with self._lock:
+            pools = self._documents.setdefault(key, pools)
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        return pools
+
+    @staticmethod
+    def _add_to(pools: Dict[str, MinHashLSH], questions: List[Question]) -> None:
+        for question in questions:
+            if not _is_valid_question(question):
+                continue
+            pool = pools.setdefault(question.type, MinHashLSH())
+            signature = pool.signature(question.text)
+            if not pool.query(signature):
+                pool.add(question, signature)
+
+    def add(self, document_hash: str, difficulty: str, questions: List[Question]) -> None:
+        """Index newly generated questions of a document"""
+        self._add_to(self._pools(document_hash, difficulty), questions)
+
+    def reusable(self, document_hash: str, difficulty: str, question_type: str, limit: int,
+                 exclude: Optional[MinHashLSH] = None) -> List[Question]:
+        """Pick up to limit stored questions at random, skipping near-duplicates of exclude"""
+        pool = self._pools(document_hash, difficulty).get(question_type)
+        if limit <= 0 or not pool:
+            return []
+        candidates = pool.items()
+        random.shuffle(candidates)
+        picked = []
+        for question, signature in candidates:
+            if len(picked) == limit:
+                break
+            if exclude is not None:
+                if exclude.query(signature):
+                    continue
+                exclude.add(question, signature)
+            picked.append(question.copy())
+        return picked
+
+question_reuse_index = QuestionReuseIndex(QUESTION_REUSE_INDEX_SIZE)
+
 # API Endpoints
 
 @app.get("/")
@@ -430,7 +1604,11 @@ async def root():
             "create_exam": "/api/exams",
             "submit_answer": "/api/answers",
             "submit_exam": "/api/exams/{exam_id}/submit",
-            "get_exam_results": "/api/exams/{exam_id}/results"
+            "get_exam_results": "/api/exams/{exam_id}/results",
+            "exam_variants": "/api/question-sets/{question_set_id}/variants",
+            "cohort_analytics": "/api/question-sets/{question_set_id}/analytics",
+            "export_pdf": "/api/export/pdf",
+            "export_pdf_batch": "/api/export/pdf/batch"
         }
     }
 
@@ -441,11 +1619,12 @@ async def health_check():
         "status": "healthy",
         "libraries": {
             "pypdf2": PYPDF2_AVAILABLE,
-            "docx": DOCX_AVAILABLE,
+            "docx": True,  # Extracted with the standard library zip/XML parsers
             "pil": PIL_AVAILABLE,
             "fitz": FITZ_AVAILABLE,
             "audio": AUDIO_AVAILABLE,
-            "pdf_export": PDF_EXPORT_AVAILABLE
+            "pdf_export": PDF_EXPORT_AVAILABLE,
+            "numpy": NUMPY_AVAILABLE
         },
         "api_keys": {
             "gemini": bool(GEMINI_API_KEY),
@@ -460,24 +1639,22 @@ async def health_check():
 async def extract_text(file: UploadFile = File(...)):
     """Extract text from uploaded document"""
     try:
-        file_content = await file.read()
-        file_extension = file.filename.split('.')[-1].lower()
-        
-        if file_extension == 'pdf':
-            text = DocumentProcessor.extract_text_from_pdf(file_content)
-        elif file_extension == 'docx':
-            text = DocumentProcessor.extract_text_from_docx(file_content)
-        elif file_extension == 'txt':
-            text = DocumentProcessor.extract_text_from_txt(file_content)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+        upload = await read_upload(file, DOCUMENT_KINDS, MAX_DOCUMENT_UPLOAD_BYTES)
+        try:
+            text = DocumentProcessor.extract_text(upload)
+        finally:
+            upload.close()
         
         return {
             "filename": file.filename,
+            "file_type": upload.kind,
+            "sha256": upload.sha256,
             "text": text,
             "word_count": len(text.split()),
             "char_count": len(text)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -489,7 +1666,8 @@ async def generate_questions_api(
     num_medium: int = Form(2),
     num_long: int = Form(1),
     subject: str = Form("General Knowledge"),
-    difficulty: str = Form("Medium (Graduate Level)")
+    difficulty: str = Form("Medium (Graduate Level)"),
+    reuse_questions: bool = Form(True)
 ):
     """Generate questions from uploaded document - API endpoint for frontend"""
     try:
@@ -497,72 +1675,81 @@ async def generate_questions_api(
         print(f"[v0] Question counts - MCQ: {num_mcqs}, Short: {num_short}, Medium: {num_medium}, Long: {num_long}")
         
         # Extract text from file
-        file_content = await file.read()
-        file_extension = file.filename.split('.')[-1].lower()
-        
-        print(f"[v0] File extension: {file_extension}, Size: {len(file_content)} bytes")
-        
-        if file_extension == 'pdf':
-            text = DocumentProcessor.extract_text_from_pdf(file_content)
-        elif file_extension == 'docx':
-            text = DocumentProcessor.extract_text_from_docx(file_content)
-        elif file_extension == 'txt':
-            text = DocumentProcessor.extract_text_from_txt(file_content)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload PDF, DOCX, or TXT")
+        upload = await read_upload(file, DOCUMENT_KINDS, MAX_DOCUMENT_UPLOAD_BYTES)
+        print(f"[v0] File type: {upload.kind}, Size: {upload.size} bytes")
+        try:
+            text = DocumentProcessor.extract_text(upload)
+        finally:
+            upload.close()
         
         if not text:
             raise HTTPException(status_code=400, detail="No text could be extracted from the file")
         
         print(f"[v0] Extracted text length: {len(text)} characters")
         
-        # Generate questions
+        # Generate questions, reusing stored questions from the same document when possible
+        document_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        reuse = reuse_questions and NUMPY_AVAILABLE
         all_questions = []
+        new_questions = []
+        reused_count = 0
+        missing_questions: Dict[str, int] = {}
         question_id = 1
         
-        if num_mcqs > 0:
-            print(f"[v0] Generating {num_mcqs} MCQ questions...")
-            mcq_questions = AIModelAPI.generate_questions(
-                text, "mcq", num_mcqs, "Gemini"
-            )
-            for q in mcq_questions:
-                q.id = question_id
-                question_id += 1
-            all_questions.extend(mcq_questions)
-            print(f"[v0] Generated {len(mcq_questions)} MCQ questions")
-        
-        if num_short > 0:
-            print(f"[v0] Generating {num_short} short questions...")
-            short_questions = AIModelAPI.generate_questions(
-                text, "2_mark", num_short, "Gemini"
-            )
-            for q in short_questions:
+        for q_type, count, label in (
+            ("mcq", num_mcqs, "MCQ"),
+            ("2_mark", num_short, "short"),
+            ("5_mark", num_medium, "medium"),
+            ("10_mark", num_long, "long")
+        ):
+            if count <= 0:
+                continue
+            
+            accepted = []
+            seen = MinHashLSH() if NUMPY_AVAILABLE else None
+            reused = []
+            if reuse:
+                reused = question_reuse_index.reusable(document_hash, difficulty, q_type, int(count * QUESTION_REUSE_RATIO), seen)
+                accepted.extend(reused)
+            
+            # Ask again for questions dropped as near-duplicates, a bounded number of times
+            for attempt in range(QUESTION_GENERATION_ATTEMPTS):
+                remaining = count - len(accepted)
+                if remaining <= 0:
+                    break
+                print(f"[v0] Generating {remaining} {label} questions ({len(reused)} reused, attempt {attempt + 1})...")
+                generated = AIModelAPI.generate_questions(text, q_type, remaining, "Gemini")
+                if not generated:
+                    break
+                for q in generated:
+                    if len(accepted) == count:
+                        break
+                    if seen is not None:
+                        signature = seen.signature(q.text)
+                        if seen.query(signature):
+                            print(f"[v0] Dropped near-duplicate {label} question: {q.text[:60]}")
+                            continue
+                        seen.add(q, signature)
+                    accepted.append(q)
+                    new_questions.append(q)
+            
+            # Top up from stored questions if the model returned duplicates
+            if reuse and len(accepted) < count:
+                extra = question_reuse_index.reusable(document_hash, difficulty, q_type, count - len(accepted), seen)
+                reused.extend(extra)
+                accepted.extend(extra)
+            
+            for q in accepted:
                 q.id = question_id
                 question_id += 1
-            all_questions.extend(short_questions)
-            print(f"[v0] Generated {len(short_questions)} short questions")
+            all_questions.extend(accepted)
+            reused_count += len(reused)
+            if len(accepted) < count:
+                missing_questions[q_type] = count - len(accepted)
+            print(f"[v0] Prepared {len(accepted)} of {count} {label} questions")
         
-        if num_medium > 0:
-            print(f"[v0] Generating {num_medium} medium questions...")
-            medium_questions = AIModelAPI.generate_questions(
-                text, "5_mark", num_medium, "Gemini"
-            )
-            for q in medium_questions:
-                q.id = question_id
-                question_id += 1
-            all_questions.extend(medium_questions)
-            print(f"[v0] Generated {len(medium_questions)} medium questions")
-        
-        if num_long > 0:
-            print(f"[v0] Generating {num_long} long questions...")
-            long_questions = AIModelAPI.generate_questions(
-                text, "10_mark", num_long, "Gemini"
-            )
-            for q in long_questions:
-                q.id = question_id
-                question_id += 1
-            all_questions.extend(long_questions)
-            print(f"[v0] Generated {len(long_questions)} long questions")
+        if reuse:
+            question_reuse_index.add(document_hash, difficulty, new_questions)
         
         # Save to Supabase if available
         question_set_id = None
@@ -573,7 +1760,8 @@ async def generate_questions_api(
                     "title": f"{subject} - {file.filename}",
                     "subject": subject,
                     "difficulty": difficulty,
-                    "total_marks": sum(q.marks for q in all_questions)
+                    "total_marks": sum(q.marks for q in all_questions),
+                    "document_hash": document_hash
                 }).execute()
                 
                 question_set_id = set_result.data[0]["id"]
@@ -584,16 +1772,20 @@ async def generate_questions_api(
                 for q in all_questions:
                     questions_data.append({
                         "question_set_id": question_set_id,
+                        "position": q.id,
                         "question_text": q.text,
                         "question_type": q.type,
                         "marks": q.marks,
                         "options": q.options,
                         "correct_answer": q.correct_answer,
-                        "hint": q.hint
+                        "hint": q.hint,
+                        "sample_answer": q.sample_answer
                     })
                 
-                supabase.table("questions").insert(questions_data).execute()
+                questions_result = supabase.table("questions").insert(questions_data).execute()
                 print(f"[v0] Saved {len(questions_data)} questions to database")
+                
+                question_set_cache.put(question_set_id, set_result.data[0], questions_result.data)
             except Exception as e:
                 print(f"[v0] Database error: {str(e)}")
         
@@ -601,8 +1793,12 @@ async def generate_questions_api(
             "question_set_id": question_set_id or "local",
             "questions": [q.dict() for q in all_questions],
             "total_questions": len(all_questions),
+            "reused_questions": reused_count,
+            "missing_questions": missing_questions,
             "total_marks": sum(q.marks for q in all_questions)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[v0] Error in generate_questions_api: {str(e)}")
         import traceback
@@ -610,20 +1806,42 @@ async def generate_questions_api(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/exams")
-async def create_exam(question_set_id: str = Form(...)):
-    """Create a new exam session"""
+async def create_exam(
+    question_set_id: str = Form(...),
+    variant_seed: Optional[int] = Form(None),
+    variant_marks: Optional[str] = Form(None)
+):
+    """Create a new exam session, optionally for a seeded variant of the question set"""
     try:
         if not supabase:
             # Return mock exam ID if no database
             exam_id = f"exam_{datetime.now().timestamp()}"
             return {"exam_id": exam_id}
         
-        result = supabase.table("exams").insert({
+        exam_data = {
             "question_set_id": question_set_id,
             "status": "in_progress"
-        }).execute()
+        }
+        if variant_seed is not None:
+            try:
+                marks_per_type = ExamVariantGenerator.validate_marks(
+                    json.loads(variant_marks) if variant_marks else None
+                )
+                question_set = question_set_cache.get(question_set_id)
+                if question_set is None:
+                    raise HTTPException(status_code=404, detail="Question set not found")
+                # Fail now rather than at grading time if the variant cannot be built
+                ExamVariantGenerator.build(question_set["rows"], variant_seed, marks_per_type)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid variant_marks: {e}")
+            exam_data["variant_seed"] = variant_seed
+            exam_data["variant_marks"] = marks_per_type
+        
+        result = supabase.table("exams").insert(exam_data).execute()
         
         return {"exam_id": result.data[0]["id"]}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -644,18 +1862,23 @@ async def submit_answer(
         }
         
         # Handle file uploads if present
-        if answer_image:
-            image_content = await answer_image.read()
-            answer_data["answer_image"] = base64.b64encode(image_content).decode()
-        
-        if answer_audio:
-            audio_content = await answer_audio.read()
-            answer_data["answer_audio"] = base64.b64encode(audio_content).decode()
+        for field, upload_file, kinds in (
+            ("answer_image", answer_image, IMAGE_KINDS),
+            ("answer_audio", answer_audio, AUDIO_KINDS)
+        ):
+            if upload_file:
+                upload = await read_upload(upload_file, kinds, MAX_ANSWER_UPLOAD_BYTES)
+                try:
+                    answer_data[field] = upload.to_base64()
+                finally:
+                    upload.close()
         
         if supabase:
             supabase.table("answers").insert(answer_data).execute()
         
         return {"message": "Answer submitted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -677,18 +1900,27 @@ async def submit_exam(exam_id: str):
         if not exam.data:
             raise HTTPException(status_code=404, detail="Exam not found")
         
-        question_set_id = exam.data[0]["question_set_id"]
-        questions = supabase.table("questions").select("*").eq("question_set_id", question_set_id).execute()
+        exam_row = exam.data[0]
+        question_set_id = exam_row["question_set_id"]
+        question_set = question_set_cache.get(question_set_id)
         answers = supabase.table("answers").select("*").eq("exam_id", exam_id).execute()
         
+        # Variant exams are graded against the answer key rebuilt from their seed
+        question_rows = question_set["rows"] if question_set else []
+        if exam_row.get("variant_seed") is not None:
+            question_rows = ExamVariantGenerator.build(
+                question_rows, exam_row["variant_seed"], exam_row.get("variant_marks")
+            )
+        answers_by_question = {str(a["question_id"]): a for a in answers.data}
+        
         # Evaluate answers
         total_marks = 0
         obtained_marks = 0
         evaluated_answers = []
         
-        for question in questions.data:
+        for question in question_rows:
             total_marks += question["marks"]
-            user_answer = next((a for a in answers.data if a["question_id"] == question["id"]), None)
+            user_answer = answers_by_question.get(str(question["id"]))
             
             if user_answer:
                 # Simple evaluation logic
@@ -723,6 +1955,106 @@ async def submit_exam(exam_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/question-sets/{question_set_id}/variants")
+async def generate_exam_variants(question_set_id: str, request: ExamVariantRequest):
+    """Generate seeded exam variants from a stored question set without model calls.
+
+    Variant question ids (and answer_key keys) are questions-table row ids, as used by
+    /api/answers, and MCQ options are shuffled per seed. Variants are therefore graded
+    only through /api/exams/{exam_id}/submit, which rebuilds the key from the exam's
+    seed; /evaluate-answers takes the generated position ids and the unshuffled key.
+    """
+    try:
+        if not supabase:
+            raise HTTPException(status_code=400, detail="Database not configured")
+        if request.num_variants < 1:
+            raise HTTPException(status_code=400, detail="num_variants must be at least 1")
+        
+        question_set = question_set_cache.get(question_set_id)
+        if not question_set or not question_set["rows"]:
+            raise HTTPException(status_code=404, detail="Question set not found")
+        rows = question_set["rows"]
+        
+        base_seed = request.seed if request.seed is not None else secrets.randbits(30)
+        variants = []
+        for i in range(request.num_variants):
+            seed = base_seed + i
+            try:
+                variant_rows = ExamVariantGenerator.build(rows, seed, request.marks_per_type)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            variant = {
+                "seed": seed,
+                "marks_per_type": request.marks_per_type,
+                "questions": [{
+                    "id": row["id"],
+                    "text": row["question_text"],
+                    "type": row["question_type"],
+                    "marks": row["marks"],
+                    "options": row.get("options"),
+                    "hint": row.get("hint")
+                } for row in variant_rows],
+                "total_marks": sum(row["marks"] for row in variant_rows)
+            }
+            if request.include_answers:
+                variant["answer_key"] = {
+                    str(row["id"]): row["correct_answer"] for row in variant_rows if row.get("correct_answer")
+                }
+            variants.append(variant)
+        
+        if request.create_exams:
+            result = supabase.table("exams").insert([{
+                "question_set_id": question_set_id,
+                "status": "in_progress",
+                "variant_seed": v["seed"],
+                "variant_marks": v["marks_per_type"]
+            } for v in variants]).execute()
+            for variant, exam_row in zip(variants, result.data):
+                variant["exam_id"] = exam_row["id"]
+        
+        return {
+            "question_set_id": question_set_id,
+            "base_seed": base_seed,
+            "variants": variants
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/question-sets/{question_set_id}/analytics")
+async def get_cohort_analytics(question_set_id: str):
+    """Grade and analyse every completed exam of a question set in one pass"""
+    try:
+        if not supabase:
+            raise HTTPException(status_code=400, detail="Database not configured")
+        if not NUMPY_AVAILABLE:
+            raise HTTPException(status_code=500, detail="Analytics require numpy")
+        
+        question_set = question_set_cache.get(question_set_id)
+        if question_set is None:
+            raise HTTPException(status_code=404, detail="Question set not found")
+        
+        exams = _fetch_all_rows(lambda: supabase.table("exams").select("*")
+                                .eq("question_set_id", question_set_id)
+                                .eq("status", "completed").order("id"))
+        answers = []
+        exam_ids = [exam["id"] for exam in exams]
+        for start in range(0, len(exam_ids), 200):
+            chunk = exam_ids[start:start + 200]
+            answers.extend(_fetch_all_rows(lambda: supabase.table("answers")
+                                           .select("exam_id,question_id,answer_text")
+                                           .in_("exam_id", chunk).order("id")))
+        
+        analytics = CohortAnalytics.compute(question_set["rows"], exams, answers)
+        analytics["question_set_id"] = question_set_id
+        return analytics
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/exams/{exam_id}/results")
 async def get_exam_results(exam_id: str):
     """Get exam results"""
@@ -746,35 +2078,63 @@ async def get_exam_results(exam_id: str):
 
 @app.post("/evaluate-answers")
 async def evaluate_answers(submission: ExamSubmission):
-    """Evaluate exam answers"""
+    """Evaluate exam answers against a cached question set"""
     try:
-        # This endpoint expects questions to be stored or passed with answers
-        # For now, we'll return a simple response
-        # In production, you'd retrieve questions from a database or session
+        question_set = None
+        if submission.question_set_id:
+            question_set = question_set_cache.get(submission.question_set_id)
+            if question_set is None:
+                raise HTTPException(status_code=404, detail="Question set not found")
         
         results = []
-        total_score = 0
+        gradable = []
         
         for answer in submission.answers:
-            # Mock evaluation - in production, retrieve actual question
-            result = {
-                "question_id": answer.question_id,
-                "score": 0,
-                "max_score": 5,
-                "feedback": "Question data not available for evaluation",
-                "correct": False
-            }
-            results.append(result)
+            # Question ids are the ones returned by /api/generate-questions
+            question = question_set["by_id"].get(answer.question_id) if question_set else None
+            if question is None:
+                results.append({
+                    "question_id": answer.question_id,
+                    "score": 0,
+                    "max_score": 0,
+                    "feedback": "Question data not available for evaluation",
+                    "correct": False
+                })
+            else:
+                results.append(None)
+                gradable.append((len(results) - 1, question, answer.answer))
+        
+        if gradable:
+            evaluations = AIModelAPI.evaluate_answers(
+                [(question, user_answer) for _, question, user_answer in gradable],
+                subject=question_set["meta"].get("subject") or "General Knowledge"
+            )
+            for (index, question, _), result in zip(gradable, evaluations):
+                result["question_id"] = question.id
+                results[index] = result
+        
+        total_score = sum(r["score"] for r in results)
+        max_score = sum(r["max_score"] for r in results)
         
         return {
             "username": submission.username,
+            "question_set_id": submission.question_set_id,
             "results": results,
             "total_score": total_score,
+            "max_score": max_score,
             "timestamp": datetime.now().isoformat()
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/api/question-sets/{question_set_id}/cache")
+async def invalidate_question_set_cache(question_set_id: str):
+    """Drop a question set from the in-process cache"""
+    question_set_cache.invalidate(question_set_id)
+    return {"message": "Question set cache invalidated", "question_set_id": question_set_id}
+
 @app.post("/text-to-speech")
 async def text_to_speech(text: str = Form(...)):
     """Convert text to speech"""
@@ -795,8 +2155,11 @@ async def text_to_speech(text: str = Form(...)):
 async def pdf_to_images(file: UploadFile = File(...)):
     """Convert PDF pages to images"""
     try:
-        file_content = await file.read()
-        images = DocumentProcessor.pdf_to_images(file_content)
+        upload = await read_upload(file, ("pdf",), MAX_PDF_IMAGES_UPLOAD_BYTES)
+        try:
+            images = DocumentProcessor.pdf_to_images(upload.source())
+        finally:
+            upload.close()
         
         if not images:
             raise HTTPException(status_code=500, detail="Failed to convert PDF to images")
@@ -818,9 +2181,59 @@ async def pdf_to_images(file: UploadFile = File(...)):
             "total_pages": len(images),
             "images": image_data
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/export/pdf")
+async def export_pdf(request: ExamPaperRequest):
+    """Export a question set as a printable PDF exam paper"""
+    try:
+        if not PDF_EXPORT_AVAILABLE:
+            raise HTTPException(status_code=500, detail="PDF export is not available")
+
+        paper = _build_exam_papers([request])[0]
+        pdf_data = _render_exam_paper(json.dumps(paper, sort_keys=True))
+
+        return StreamingResponse(
+            io.BytesIO(pdf_data),
+            media_type="application/pdf",
+            headers={"Content-Disposition": f"attachment; filename={_paper_slug(paper['title'])}.pdf"}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/export/pdf/batch")
+async def export_pdf_batch(request: BatchExamPaperRequest):
+    """Export many exam papers as a streamed ZIP archive"""
+    try:
+        if not PDF_EXPORT_AVAILABLE:
+            raise HTTPException(status_code=500, detail="PDF export is not available")
+        if not request.papers:
+            raise HTTPException(status_code=400, detail="No papers requested")
+
+        papers = _build_exam_papers(request.papers)
+        _get_pdf_export_pool()
+
+        return StreamingResponse(
+            PDFExporter.stream_zip(papers),
+            media_type="application/zip",
+            headers={"Content-Disposition": "attachment; filename=exam_papers.zip"}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.on_event("shutdown")
+def shutdown_pdf_export_pool():
+    """Stop PDF export workers"""
+    if _pdf_export_pool is not None:
+        _pdf_export_pool.shutdown(cancel_futures=True)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,22 @@
+-- Columns written by the FastAPI backend on top of 001_create_schema.sql.
+-- Safe to run more than once.
+
+-- Hash of the extracted document text, used to reuse questions across sets of
+-- the same document and difficulty
+alter table public.question_sets add column if not exists document_hash text;
+create index if not exists question_sets_document_hash_difficulty_idx
+  on public.question_sets (document_hash, difficulty);
+
+-- Model answer used to pre-grade subjective answers locally
+alter table public.questions add column if not exists sample_answer text;
+
+-- Generated position of a question within its set; this is the question_id
+-- returned by /api/generate-questions and expected by /evaluate-answers
+alter table public.questions add column if not exists position integer;
+create index if not exists questions_question_set_id_position_idx
+  on public.questions (question_set_id, position);
+
+-- Seed and per-type mark targets of exams taken as a seeded variant; the
+-- answer key is rebuilt from them at grading time
+alter table public.exams add column if not exists variant_seed bigint;
+alter table public.exams add column if not exists variant_marks jsonb;
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from main import AnswerPreGrader, Question
+
+SAMPLE = ("Photosynthesis converts light energy into chemical energy stored in glucose, "
+          "using carbon dioxide and water and releasing oxygen.")
+
+
+def settle(answer, question=None):
+    question = question or Question(id=1, text="What does photosynthesis do?", type="5_mark",
+                                    marks=5, sample_answer=SAMPLE, hint="Think about energy")
+    sample_sim, reference_sim, coverage = AnswerPreGrader.similarities([(question, answer)])
+    return AnswerPreGrader.settle(question, answer, sample_sim[0], reference_sim[0], coverage[0])
+
+
+def test_verbatim_answer_gets_full_marks_locally():
+    result = settle(SAMPLE)
+    assert result["score"] == 5
+    assert result["graded_by"] == "pregrade"
+
+
+def test_reversed_answer_goes_to_model():
+    reversed_answer = ("Photosynthesis converts chemical energy stored in glucose into light energy, "
+                       "using carbon dioxide and water and releasing oxygen.")
+    assert settle(reversed_answer) is None
+
+
+def test_negated_answer_goes_to_model():
+    negated_answer = ("Photosynthesis does not convert light energy into chemical energy stored in glucose, "
+                      "using carbon dioxide and water and releasing oxygen.")
+    assert settle(negated_answer) is None
+
+
+def test_paraphrase_goes_to_model():
+    paraphrase = ("Plants capture sunlight and turn it into sugar made from CO2 and H2O, "
+                  "giving off O2 as a by-product.")
+    assert settle(paraphrase) is None
+
+
+def test_very_short_unrelated_answer_gets_zero():
+    assert settle("Banana")["score"] == 0
+
+
+def test_hint_only_question_goes_to_model():
+    question = Question(id=1, text="What does photosynthesis do?", type="5_mark", marks=5,
+                        hint="Think about energy")
+    assert settle("Banana", question) is None
+
+
+def test_score_does_not_depend_on_the_batch():
+    question = Question(id=1, text="What does photosynthesis do?", type="5_mark", marks=5, sample_answer=SAMPLE)
+    other = Question(id=2, text="What is osmosis?", type="5_mark", marks=5,
+                     sample_answer="Osmosis is the movement of water across a membrane.")
+    answer = "Photosynthesis stores light energy in glucose."
+    alone = AnswerPreGrader.similarities([(question, answer)])[0][0]
+    batched = AnswerPreGrader.similarities([(other, "water membrane energy"), (question, answer)])[0][1]
+    assert alone == pytest.approx(batched)
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from main import MinHashLSH
+
+DUPLICATES = [
+    ("What is the primary function of chlorophyll?", "What is the main function of chlorophyll?"),
+    ("What is the role of mitochondria in a cell?", "What is the role of the mitochondria in cells?"),
+    ("Explain the process of photosynthesis in plants.", "Explain the process of photosynthesis in green plants."),
+    ("Which organelle is known as the powerhouse of the cell?", "Which organelle is called the powerhouse of the cell?"),
+]
+
+DISTINCT = [
+    ("What is a function of the liver?", "What is a function of the kidney?"),
+    ("Explain the role of enzymes in digestion.", "Explain the role of hormones in digestion."),
+    ("What causes A to affect B?", "What causes B to affect A?"),
+    ("Describe the structure of DNA.", "Describe the structure of RNA."),
+    ("What are the causes of soil erosion?", "What are the effects of soil erosion?"),
+]
+
+
+def is_duplicate(first, second):
+    index = MinHashLSH()
+    index.add(first, index.signature(first))
+    return bool(index.query(index.signature(second)))
+
+
+@pytest.mark.parametrize("first,second", DUPLICATES)
+def test_rewordings_are_duplicates(first, second):
+    assert is_duplicate(first, second)
+
+
+@pytest.mark.parametrize("first,second", DISTINCT)
+def test_questions_sharing_a_template_are_distinct(first, second):
+    assert not is_duplicate(first, second)